@@ -0,0 +1,17 @@
+import os
+
+from numba.pycc import CC
+
+from src.kernels import indicator_state
+
+# Предварительная (AOT) компиляция ядра индикаторов в src/ema_kernels.*.so.
+# Запускается один раз при установке: python compile_kernels.py
+cc = CC('ema_kernels')
+cc.output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+
+# Экспортируется исходная Python-функция ядра; сигнатура фиксирована под float64.
+# Параллельное indicator_states_batch заранее не компилируется (см. src/strategies.py)
+cc.export('indicator_state', 'UniTuple(f8, 6)(f8[:], i8)')(indicator_state.py_func)
+
+if __name__ == '__main__':
+    cc.compile()
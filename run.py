@@ -1,5 +1,5 @@
 from src.main import main
+from src.utils import run_event_loop
 
 if __name__ == '__main__':
-    import asyncio
-    asyncio.run(main())
+    run_event_loop(main())
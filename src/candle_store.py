@@ -0,0 +1,33 @@
+import sqlite3
+
+import numpy as np
+
+# Локальное хранилище закрытых свечей (SQLite): после перезапуска буферы пар
+# восстанавливаются из файла, и с биржи запрашиваются только недостающие свечи
+
+def open_candle_store(path):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS candles ('
+        'symbol TEXT, timeframe TEXT, ts INTEGER, '
+        'open REAL, high REAL, low REAL, close REAL, volume REAL, '
+        'PRIMARY KEY (symbol, timeframe, ts)) WITHOUT ROWID'
+    )
+    conn.commit()
+    return conn
+
+def load_candles(conn, symbol, timeframe, limit):
+    # Последние limit свечей пары в порядке возрастания времени (столбцы как в ccxt)
+    rows = conn.execute(
+        'SELECT ts, open, high, low, close, volume FROM candles '
+        'WHERE symbol = ? AND timeframe = ? ORDER BY ts DESC LIMIT ?',
+        (symbol, timeframe, limit)
+    ).fetchall()
+    return np.array(rows[::-1], dtype=np.float64).reshape(-1, 6)
+
+def save_candles(conn, symbol, timeframe, rows):
+    # Запись закрытых свечей; уже сохранённые перезаписываются. Фиксация — на стороне вызывающего
+    conn.executemany(
+        'INSERT OR REPLACE INTO candles VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        [(symbol, timeframe, int(row[0]), *row[1:6]) for row in rows.tolist()]
+    )
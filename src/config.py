@@ -1,4 +1,5 @@
 import os
+from dataclasses import dataclass
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -7,6 +8,8 @@ TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 TP_PERCENT = float(os.getenv('TAKE_PROFIT_PERCENT', '2.0'))
 SL_PERCENT = float(os.getenv('STOP_LOSS_PERCENT', '1.0'))
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+USE_WEBSOCKET = os.getenv('USE_WEBSOCKET', '1') == '1'
 
 SYMBOLS = [
     'BTC/USDT', 'ETH/USDT', 'BNB/USDT', 'SOL/USDT',
@@ -20,7 +23,32 @@ SYMBOLS = [
 ]
 TIMEFRAME = '1h'
 LIMIT = 150
+INCREMENTAL_LIMIT = 3
+STREAM_STALE_SECONDS = 120
+STREAM_RETRY_SECONDS = 5
+CANDLE_CLOSE_DELAY = 2
 ERROR_THRESHOLD = 5
 STATUS_INTERVAL = 86400
 PING_INTERVAL = 6 * 3600
 MIN_WAIT_SECONDS = 10
+CHECK_INTERVAL = 900
+FETCH_CONCURRENCY = 4
+EXCHANGE_RATE_LIMIT_MS = 20
+HTTP_POOL_LIMIT = 64
+HTTP_KEEPALIVE_SECONDS = 75
+HTTP_DNS_CACHE_SECONDS = 300
+TELEGRAM_MESSAGE_LIMIT = 4096
+TELEGRAM_SEND_INTERVAL = 1
+TELEGRAM_DRAIN_TIMEOUT = 10
+MARKETS_CACHE_FILE = os.path.join('.cache', 'bybit_markets.json')
+MARKETS_CACHE_TTL = 6 * 3600
+CANDLE_STORE_FILE = 'ohlcv.db'
+SIGNALS_STATE_FILE = 'signals_state.json'
+
+# Проверенные параметры запуска: собираются один раз в check_tokens и передаются явно
+@dataclass(frozen=True, slots=True)
+class Config:
+    token: str
+    chat_id: int
+    tp: float
+    sl: float
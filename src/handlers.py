@@ -1,3 +1,4 @@
+from telebot import asyncio_filters
 from telebot.handler_backends import State, StatesGroup
 from telebot.types import BotCommand
 import logging
@@ -9,14 +10,17 @@ class SettingsState(StatesGroup):
     waiting_for_tp = State()  # Состояние ожидания ввода тейк-профита
     waiting_for_sl = State()  # Состояние ожидания ввода стоп-лосса
 
-def register_handlers(bot, config, logger):
+def register_handlers(bot, settings, logger):
+    # Без StateFilter обработчики с параметром state не срабатывают
+    bot.add_custom_filter(asyncio_filters.StateFilter(bot))
+
     @bot.message_handler(commands=['help'])
     async def send_help(message):
         # Обработка команды /help для отображения доступных команд
-        logger.debug(f"Получена команда /help от chat_id: {message.chat.id}")
-        if str(message.chat.id) != config.TELEGRAM_CHAT_ID:
+        logger.debug("Получена команда /help от chat_id: %s", message.chat.id)
+        if message.chat.id != settings.chat_id:
             await bot.reply_to(message, "Несанкционированный доступ.")
-            logger.warning(f"Несанкционированный доступ: chat_id {message.chat.id} != {config.TELEGRAM_CHAT_ID}")
+            logger.warning("Несанкционированный доступ: chat_id %s != %s", message.chat.id, settings.chat_id)
             return
         help_text = (
             "**📋 Доступные команды бота**\n\n"
@@ -29,10 +33,10 @@ def register_handlers(bot, config, logger):
     @bot.message_handler(commands=['set_tp'])
     async def set_take_profit(message):
         # Обработка команды /set_tp отключена
-        logger.debug(f"Попытка вызова /set_tp от chat_id: {message.chat.id}")
-        if str(message.chat.id) != config.TELEGRAM_CHAT_ID:
+        logger.debug("Попытка вызова /set_tp от chat_id: %s", message.chat.id)
+        if message.chat.id != settings.chat_id:
             await bot.reply_to(message, "Несанкционированный доступ.")
-            logger.warning(f"Несанкционированный доступ: chat_id {message.chat.id} != {config.TELEGRAM_CHAT_ID}")
+            logger.warning("Несанкционированный доступ: chat_id %s != %s", message.chat.id, settings.chat_id)
             return
         await bot.reply_to(message, "Изменение тейк-профита через Telegram отключено.")
         logger.info("Попытка изменения тейк-профита заблокирована")
@@ -40,7 +44,7 @@ def register_handlers(bot, config, logger):
     @bot.message_handler(state=SettingsState.waiting_for_tp)
     async def process_tp(message):
         # Обработка ввода тейк-профита отключена
-        logger.debug(f"Попытка ввода тейк-профита: {message.text}")
+        logger.debug("Попытка ввода тейк-профита: %s", message.text)
         await bot.reply_to(message, "Изменение тейк-профита через Telegram отключено.")
         logger.info("Попытка ввода тейк-профита заблокирована")
         await bot.delete_state(message.from_user.id, message.chat.id)
@@ -48,10 +52,10 @@ def register_handlers(bot, config, logger):
     @bot.message_handler(commands=['set_sl'])
     async def set_stop_loss(message):
         # Обработка команды /set_sl отключена
-        logger.debug(f"Попытка вызова /set_sl от chat_id: {message.chat.id}")
-        if str(message.chat.id) != config.TELEGRAM_CHAT_ID:
+        logger.debug("Попытка вызова /set_sl от chat_id: %s", message.chat.id)
+        if message.chat.id != settings.chat_id:
             await bot.reply_to(message, "Несанкционированный доступ.")
-            logger.warning(f"Несанкционированный доступ: chat_id {message.chat.id} != {config.TELEGRAM_CHAT_ID}")
+            logger.warning("Несанкционированный доступ: chat_id %s != %s", message.chat.id, settings.chat_id)
             return
         await bot.reply_to(message, "Изменение стоп-лосса через Telegram отключено.")
         logger.info("Попытка изменения стоп-лосса заблокирована")
@@ -59,14 +63,14 @@ def register_handlers(bot, config, logger):
     @bot.message_handler(state=SettingsState.waiting_for_sl)
     async def process_sl(message):
         # Обработка ввода стоп-лосса отключена
-        logger.debug(f"Попытка ввода стоп-лосса: {message.text}")
+        logger.debug("Попытка ввода стоп-лосса: %s", message.text)
         await bot.reply_to(message, "Изменение стоп-лосса через Telegram отключено.")
         logger.info("Попытка ввода стоп-лосса заблокирована")
         await bot.delete_state(message.from_user.id, message.chat.id)
 
-def setup_bot_commands(bot):
+async def setup_bot_commands(bot):
     # Регистрация только команды /help
     commands = [
         BotCommand("help", "Показать список доступных команд")
     ]
-    bot.set_my_commands(commands)
+    await bot.set_my_commands(commands)
@@ -0,0 +1,52 @@
+import numpy as np
+
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        # Без Numba ядра выполняются как обычные Python-функции
+        return lambda func: func
+
+# Коэффициенты сглаживания EMA7/30/9/20 вычисляются один раз при импорте;
+# Numba подставляет глобальные константы в ядро при компиляции
+ALPHA7, ALPHA30, ALPHA9, ALPHA20 = 2.0 / 8, 2.0 / 31, 2.0 / 10, 2.0 / 21
+
+@njit(cache=True)
+def indicator_state(close, rsi_period):
+    # Состояние рекуррентных индикаторов после прохода по всем close:
+    # EMA7/30/9/20 и средние Уайлдера (avg_gain, avg_loss)
+    n = close.shape[0]
+    a7, a30, a9, a20 = ALPHA7, ALPHA30, ALPHA9, ALPHA20
+    e7 = e30 = e9 = e20 = close[0]
+    avg_gain = 0.0
+    avg_loss = 0.0
+    for i in range(1, n):
+        x = close[i]
+        e7 = a7 * x + (1 - a7) * e7
+        e30 = a30 * x + (1 - a30) * e30
+        e9 = a9 * x + (1 - a9) * e9
+        e20 = a20 * x + (1 - a20) * e20
+        delta = x - close[i - 1]
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+        if i <= rsi_period:
+            avg_gain += gain / rsi_period
+            avg_loss += loss / rsi_period
+        else:
+            avg_gain = (avg_gain * (rsi_period - 1) + gain) / rsi_period
+            avg_loss = (avg_loss * (rsi_period - 1) + loss) / rsi_period
+    return (e7, e30, e9, e20, avg_gain, avg_loss)
+
+@njit(cache=True, parallel=True)
+def indicator_states_batch(closes, rsi_period):
+    # Начальные состояния для всех пар за один вызов: строки closes — пары, результат (пары × 6)
+    out = np.empty((closes.shape[0], 6))
+    for s in prange(closes.shape[0]):
+        values = indicator_state(closes[s], rsi_period)
+        for j in range(6):
+            out[s, j] = values[j]
+    return out
@@ -1,226 +1,631 @@
 import asyncio
-from datetime import datetime, timedelta, timezone
-import ccxt.async_support as ccxt
-import pandas as pd
-import telebot
-from telebot.storage import StateMemoryStorage
+import json
+import os
+import ssl
+import time
+from datetime import datetime, timezone
+import aiohttp
+import ccxt.pro as ccxtpro
+import certifi
+from ccxt.base.exchange import Exchange
+import numpy as np
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_storage import StateMemoryStorage
+
+# orjson (необязательный) читает и пишет кэш рынков в 3-5 раз быстрее стандартного json;
+# ответы биржи ccxt сам разбирает через orjson, если он установлен
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from src.config import (
-    TELEGRAM_TOKEN, TELEGRAM_CHAT_ID, TP_PERCENT, SL_PERCENT,
-    SYMBOLS, TIMEFRAME, LIMIT, ERROR_THRESHOLD, STATUS_INTERVAL, PING_INTERVAL, MIN_WAIT_SECONDS
+    LOG_LEVEL,
+    SYMBOLS, TIMEFRAME, LIMIT, ERROR_THRESHOLD, STATUS_INTERVAL, PING_INTERVAL, MIN_WAIT_SECONDS,
+    CHECK_INTERVAL, FETCH_CONCURRENCY, EXCHANGE_RATE_LIMIT_MS, TELEGRAM_MESSAGE_LIMIT, TELEGRAM_SEND_INTERVAL,
+    TELEGRAM_DRAIN_TIMEOUT,
+    HTTP_POOL_LIMIT, HTTP_KEEPALIVE_SECONDS, HTTP_DNS_CACHE_SECONDS,
+    MARKETS_CACHE_FILE, MARKETS_CACHE_TTL, INCREMENTAL_LIMIT, CANDLE_STORE_FILE, SIGNALS_STATE_FILE,
+    USE_WEBSOCKET, STREAM_STALE_SECONDS, STREAM_RETRY_SECONDS, CANDLE_CLOSE_DELAY
+)
+from src.utils import (
+    setup_logging, check_tokens, send_message, enqueue_messages, run_sender, send_critical_message, MissingTokenError
+)
+from src.strategies import (
+    seed_indicator_states, advance_indicator_state, indicators_from_state,
+    has_crossover, check_signal_ema7_30, check_signal_ema9_20_rsi
 )
-from src.utils import setup_logging, check_tokens, send_message, send_critical_message, MissingTokenError
-from src.strategies import check_signal_ema7_30, check_signal_ema9_20_rsi
 from src.handlers import register_handlers, setup_bot_commands
+from src.candle_store import open_candle_store, load_candles, save_candles
 
 # Инициализация логгера
-logger = setup_logging()
+logger = setup_logging(LOG_LEVEL)
+
+# Длительность свечи TIMEFRAME в миллисекундах
+TIMEFRAME_MS = Exchange.parse_timeframe(TIMEFRAME) * 1000
+
+# Предвыделенные буферы последних LIMIT свечей по каждой паре (столбцы как в ccxt:
+# timestamp, open, high, low, close, volume). Порядок 'F' делает столбец close непрерывным.
+candle_buffers = {}
+# Монотонное время последнего обновления буфера из WebSocket-потока
+stream_updated = {}
+# Состояние индикаторов по закрытым свечам: symbol -> (время открытия последней
+# учтённой закрытой свечи, IndicatorState)
+indicator_states = {}
+
+def validate_candles(symbol, rows):
+    # Проверка свечей на пропуски и неположительные цены
+    if not np.isfinite(rows[:, 1:]).all():
+        logger.error('Данные для %s содержат пропуски (NaN)', symbol)
+        raise ValueError(f'Пропуски в данных для {symbol}')
+    if not (rows[:, 1:5] > 0).all():
+        logger.error('Данные для %s содержат неположительные цены', symbol)
+        raise ValueError(f'Неположительные цены в данных для {symbol}')
+
+def merge_candles(buffer, rows):
+    # Запись свежих свечей в буфер на месте: буфер сдвигается на число новых свечей,
+    # уже известные (в том числе незакрытая) перезаписываются.
+    # Возвращает False, если между буфером и новыми свечами есть разрыв.
+    if rows[0, 0] > buffer[-1, 0] + TIMEFRAME_MS:
+        return False
+    start = int(np.searchsorted(buffer[:, 0], rows[0, 0]))
+    shift = max(0, start + len(rows) - len(buffer))
+    if 0 < shift < len(buffer):
+        buffer[:-shift] = buffer[shift:]
+    start -= shift
+    if start < 0:
+        rows = rows[-start:]
+        start = 0
+    buffer[start:start + len(rows)] = rows
+    return True
 
-async def get_ohlcv(exchange, symbol, log_candles=False):
-    # Получение OHLCV-данных с биржи с проверкой их валидности
+async def get_ohlcv(exchange, symbol, semaphore, log_candles=False):
+    # Получение OHLCV-данных с биржи с проверкой их валидности.
+    # Если для пары уже есть буфер, запрашиваются только последние INCREMENTAL_LIMIT свечей.
+    buffer = candle_buffers.get(symbol)
+    if buffer is not None and time.monotonic() - stream_updated.get(symbol, float('-inf')) < STREAM_STALE_SECONDS:
+        # Буфер поддерживается WebSocket-потоком — REST-запрос не нужен
+        return buffer
+    if buffer is None:
+        limit = LIMIT
+    else:
+        # Запрашиваются свечи начиная с последней в буфере; после восстановления
+        # из хранилища их может быть больше INCREMENTAL_LIMIT
+        missed = (time.time_ns() // 1_000_000 - int(buffer[-1, 0])) // TIMEFRAME_MS + 1
+        limit = min(LIMIT, max(INCREMENTAL_LIMIT, missed))
     try:
-        data = await asyncio.wait_for(
-            exchange.fetch_ohlcv(symbol, timeframe=TIMEFRAME, limit=LIMIT),
-            timeout=30.0
-        )
+        # Семафор ограничивает число одновременных запросов к бирже
+        async with semaphore:
+            data = await asyncio.wait_for(
+                exchange.fetch_ohlcv(symbol, timeframe=TIMEFRAME, limit=limit),
+                timeout=30.0
+            )
         if not data:
-            logger.error(f'Нет данных для {symbol}')
+            logger.error('Нет данных для %s', symbol)
             raise ValueError(f'Нет данных для {symbol}')
-        df = pd.DataFrame(data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        rows = np.asarray(data, dtype=np.float64)
         # Логируем количество свечей для каждой пары, если log_candles=True
         if log_candles:
-            logger.info(f'Успешно получено {len(df)} свечей для {symbol}')
-        if len(df) < LIMIT:
-            logger.warning(f'Недостаточно данных для {symbol}: {len(df)} свечей')
-        if df[['open', 'high', 'low', 'close', 'volume']].isnull().any().any():
-            logger.error(f'Данные для {symbol} содержат пропуски (NaN)')
-            raise ValueError(f'Пропуски в данных для {symbol}')
-        if (df[['open', 'high', 'low', 'close']] <= 0).any().any():
-            logger.error(f'Данные для {symbol} содержат неположительные цены')
-            raise ValueError(f'Неположительные цены в данных для {symbol}')
-        last_timestamp = pd.to_datetime(df['timestamp'].iloc[-1], unit='ms', utc=True)
-        now = pd.Timestamp.now(timezone.utc)
-        time_diff = (now - last_timestamp).total_seconds()
-        if time_diff > 7200:
+            logger.info('Успешно получено %d свечей для %s', len(rows), symbol)
+        if buffer is None and len(rows) < LIMIT:
+            logger.warning('Недостаточно данных для %s: %d свечей', symbol, len(rows))
+        validate_candles(symbol, rows)
+        if buffer is None:
+            if len(rows) < LIMIT:
+                # Неполная история не кэшируется: сигналы по ней всё равно не считаются
+                buffer = rows
+            else:
+                buffer = np.empty((LIMIT, rows.shape[1]), dtype=np.float64, order='F')
+                buffer[:] = rows[-LIMIT:]
+                candle_buffers[symbol] = buffer
+        elif not merge_candles(buffer, rows):
+            # Новые свечи не стыкуются с буфером — пропуск, загружаем историю заново
+            logger.warning('Разрыв в кэше свечей для %s, полная загрузка', symbol)
+            del candle_buffers[symbol]
+            return await get_ohlcv(exchange, symbol, semaphore, log_candles)
+        # Возраст последней свечи считается по целым миллисекундам ccxt, без объектов дат
+        last_ts_ms = int(buffer[-1, 0])
+        age_ms = time.time_ns() // 1_000_000 - last_ts_ms
+        if age_ms > 7_200_000:
             logger.warning(
-                f'Данные для {symbol} ({TIMEFRAME}) устарели: последняя свеча {last_timestamp} '
-                f'({time_diff/3600:.1f} часов назад)'
+                'Данные для %s (%s) устарели: последняя свеча %s (%.1f часов назад)',
+                symbol, TIMEFRAME, datetime.fromtimestamp(last_ts_ms / 1000.0, timezone.utc), age_ms / 3_600_000
             )
-        return df
+        return buffer
     except asyncio.TimeoutError:
-        logger.error(f'Тайм-аут при получении OHLCV для {symbol}: превышено время ожидания (30 секунд)')
+        logger.error('Тайм-аут при получении OHLCV для %s: превышено время ожидания (30 секунд)', symbol)
         raise
     except Exception as e:
-        logger.error(f'Ошибка получения котировок для {symbol}: {e}')
+        logger.error('Ошибка получения котировок для %s: %s', symbol, e)
         raise
 
+async def get_ohlcv_tagged(exchange, symbol, semaphore, log_candles=False):
+    # Результат помечается парой, чтобы обрабатывать пары по мере готовности (as_completed)
+    try:
+        return symbol, await get_ohlcv(exchange, symbol, semaphore, log_candles)
+    except Exception as e:
+        return symbol, e
+
+def apply_stream_candles(symbol, candles, candle_closed):
+    # Свечи из WebSocket пишутся прямо в буфер пары, и get_ohlcv обходится
+    # без REST-запроса, пока поток свежий
+    buffer = candle_buffers.get(symbol)
+    if buffer is None or not candles:
+        # История ещё не загружена через REST — ждём следующего обновления
+        return
+    rows = np.asarray(candles, dtype=np.float64)
+    try:
+        validate_candles(symbol, rows)
+    except ValueError:
+        stream_updated.pop(symbol, None)
+        return
+    last_open = buffer[-1, 0]
+    if merge_candles(buffer, rows):
+        stream_updated[symbol] = time.monotonic()
+        if buffer[-1, 0] > last_open:
+            # Предыдущая свеча закрылась — основной цикл проверит сигналы, не дожидаясь дедлайна
+            candle_closed.set()
+    else:
+        logger.warning('Разрыв в WebSocket-потоке для %s, история будет загружена заново', symbol)
+        candle_buffers.pop(symbol, None)
+        stream_updated.pop(symbol, None)
+
+async def watch_candles(exchange, symbol, candle_closed):
+    # Подписка на свечи одной пары (если биржа не умеет подписку на несколько пар сразу)
+    while True:
+        try:
+            candles = await exchange.watch_ohlcv(symbol, TIMEFRAME)
+            apply_stream_candles(symbol, candles, candle_closed)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning('Ошибка WebSocket-потока для %s: %s', symbol, e)
+            stream_updated.pop(symbol, None)
+            await asyncio.sleep(STREAM_RETRY_SECONDS)
+
+async def watch_candles_for_symbols(exchange, symbols, candle_closed):
+    # Одна WebSocket-подписка на свечи всех пар вместо отдельной подписки на каждую
+    subscriptions = [[symbol, TIMEFRAME] for symbol in symbols]
+    while True:
+        try:
+            updates = await exchange.watch_ohlcv_for_symbols(subscriptions)
+            for symbol, by_timeframe in updates.items():
+                apply_stream_candles(symbol, by_timeframe.get(TIMEFRAME), candle_closed)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning('Ошибка WebSocket-потока: %s', e)
+            for symbol in symbols:
+                stream_updated.pop(symbol, None)
+            await asyncio.sleep(STREAM_RETRY_SECONDS)
+
+def restore_candle_buffers(store, symbols):
+    # Буферы пар без истории восстанавливаются из хранилища, если там есть LIMIT
+    # последовательных свечей и до текущего момента пропущено меньше LIMIT свечей
+    now_ms = time.time_ns() // 1_000_000
+    restored = 0
+    for symbol in symbols:
+        if symbol in candle_buffers:
+            continue
+        rows = load_candles(store, symbol, TIMEFRAME, LIMIT)
+        if len(rows) < LIMIT or now_ms - rows[-1, 0] >= (LIMIT - 1) * TIMEFRAME_MS:
+            continue
+        if not (np.diff(rows[:, 0]) == TIMEFRAME_MS).all():
+            continue
+        buffer = np.empty((LIMIT, rows.shape[1]), dtype=np.float64, order='F')
+        buffer[:] = rows
+        candle_buffers[symbol] = buffer
+        restored += 1
+    logger.info('Из хранилища восстановлена история %d/%d пар', restored, len(symbols))
+
+def advance_indicators(symbol, buffer):
+    # Состояние по закрытым свечам продвигается на новые закрытые свечи за O(1) на свечу.
+    # Возвращает None, если состояния нет или учтённой свечи нет в буфере (разрыв в данных):
+    # такие пары инициализируются пакетом через seed_indicators
+    entry = indicator_states.get(symbol)
+    if entry is None:
+        return None
+    timestamps = buffer[:, 0]
+    last_ts, state = entry
+    if last_ts != timestamps[-2]:
+        start = int(np.searchsorted(timestamps, last_ts))
+        if start >= len(timestamps) - 2 or timestamps[start] != last_ts:
+            logger.debug('Состояние индикаторов %s пересчитывается заново', symbol)
+            return None
+        for close in buffer[start + 1:-1, 4].tolist():
+            state = advance_indicator_state(state, close)
+        indicator_states[symbol] = (timestamps[-2], state)
+    return indicators_from_state(state, float(buffer[-1, 4]))
+
+def seed_indicators(symbols, buffers):
+    # Все пары без состояния инициализируются одним вызовом параллельного ядра
+    states = seed_indicator_states(np.stack([buffer[:-1, 4] for buffer in buffers]))
+    batch = []
+    for symbol, buffer, state in zip(symbols, buffers, states):
+        indicator_states[symbol] = (buffer[-2, 0], state)
+        batch.append(indicators_from_state(state, float(buffer[-1, 4])))
+    return batch
+
+async def load_markets_cached(exchange):
+    # Загрузка рынков из JSON-файла, если он моложе MARKETS_CACHE_TTL, иначе — с биржи
+    try:
+        if time.time() - os.path.getmtime(MARKETS_CACHE_FILE) < MARKETS_CACHE_TTL:
+            with open(MARKETS_CACHE_FILE, 'rb') as f:
+                data = f.read()
+            # set_markets избавляет fetch_ohlcv от повторного load_markets
+            exchange.set_markets(orjson.loads(data) if orjson is not None else json.loads(data))
+            logger.info("Рынки загружены из кэша %s", MARKETS_CACHE_FILE)
+            return exchange.markets
+        logger.info("Кэш рынков устарел, загрузка с биржи")
+    except (OSError, ValueError) as e:
+        logger.info("Кэш рынков недоступен (%s), загрузка с биржи", e)
+    markets = await exchange.load_markets()
+    try:
+        os.makedirs(os.path.dirname(MARKETS_CACHE_FILE), exist_ok=True)
+        data = orjson.dumps(markets) if orjson is not None else json.dumps(markets).encode()
+        # Запись через временный файл: прерванная запись не оставит повреждённый кэш
+        tmp_file = MARKETS_CACHE_FILE + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_file, MARKETS_CACHE_FILE)
+    except (OSError, TypeError) as e:
+        logger.warning("Не удалось сохранить кэш рынков: %s", e)
+    return markets
+
 async def validate_symbols(exchange, symbols):
     # Проверка доступности торговых пар на бирже
     logger.debug("Проверка доступности торговых пар")
     try:
-        markets = await exchange.load_markets()
+        markets = await load_markets_cached(exchange)
         valid_symbols = [s for s in symbols if s in markets]
         if len(valid_symbols) < len(symbols):
-            logger.warning(f'Недоступные пары: {set(symbols) - set(valid_symbols)}')
+            logger.warning('Недоступные пары: %s', set(symbols) - set(valid_symbols))
         if not valid_symbols:
             raise ValueError('Нет доступных торговых пар')
-        logger.debug(f"Доступные пары: {valid_symbols}")
+        logger.debug("Доступные пары: %s", valid_symbols)
         return valid_symbols
     except Exception as e:
-        logger.critical(f'Ошибка загрузки торговых пар: {e}')
+        logger.critical('Ошибка загрузки торговых пар: %s', e)
         raise
 
-def calc_oco_prices(direction, price, tp_perc=TP_PERCENT, sl_perc=SL_PERCENT):
-    # Расчёт цен для OCO-ордера (тейк-профит и стоп-лосс)
-    if direction.startswith('LONG'):
-        tp_price = round(price * (1 + tp_perc/100), 4)
-        sl_trigger = round(price * (1 - sl_perc/100), 4)
-        sl_market = round(sl_trigger * 0.999, 4)
-    else:  # SHORT
-        tp_price = round(price * (1 - tp_perc/100), 4)
-        sl_trigger = round(price * (1 + sl_perc/100), 4)
-        sl_market = round(sl_trigger * 1.001, 4)
-    return tp_price, sl_trigger, sl_market
+def load_last_signals():
+    # Последние отправленные сигналы переживают перезапуск: после сбоя бот не повторяет
+    # в Telegram сигналы, которые уже были отправлены
+    try:
+        with open(SIGNALS_STATE_FILE, encoding='utf-8') as f:
+            state = json.load(f)
+        return state['ema7_30'], state['ema9_20_rsi']
+    except (OSError, ValueError, KeyError) as e:
+        logger.debug("Сохранённые сигналы недоступны: %s", e)
+        return {}, {}
+
+def save_last_signals(signals_7_30, signals_9_20_rsi):
+    # Запись через временный файл: при сбое во время записи старое состояние не портится
+    tmp_file = SIGNALS_STATE_FILE + '.tmp'
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'ema7_30': signals_7_30, 'ema9_20_rsi': signals_9_20_rsi}, f)
+        os.replace(tmp_file, SIGNALS_STATE_FILE)
+    except OSError as e:
+        logger.warning("Не удалось сохранить последние сигналы: %s", e)
+
+# Цены OCO-ордера округляются до 4 знаков через целые «тики» 1e-4
+PRICE_SCALE = 10_000
+
+def oco_factors(tp_perc, sl_perc):
+    # Множители цены (тейк-профит, стоп-триггер, стоп-рыночная) для LONG и SHORT;
+    # считаются один раз при запуске, так как TP/SL из Telegram не меняются
+    long_sl = 1 - sl_perc / 100
+    short_sl = 1 + sl_perc / 100
+    return (
+        (1 + tp_perc / 100, long_sl, long_sl * 0.999),
+        (1 - tp_perc / 100, short_sl, short_sl * 1.001),
+    )
+
+def calc_oco_prices(is_long, price, factors):
+    # Расчёт цен для OCO-ордера (тейк-профит и стоп-лосс). Цена и множители положительны
+    # (check_tokens допускает TP/SL только в диапазоне 0 < x < 100%), поэтому int(x + 0.5)
+    # округляет до целого числа тиков (половина — вверх, без банковского округления round);
+    # стоп-рыночная считается от цены, а не от округлённого триггера
+    tp_factor, sl_factor, sl_market_factor = factors[0] if is_long else factors[1]
+    ticks = price * PRICE_SCALE
+    return (
+        int(ticks * tp_factor + 0.5) / PRICE_SCALE,
+        int(ticks * sl_factor + 0.5) / PRICE_SCALE,
+        int(ticks * sl_market_factor + 0.5) / PRICE_SCALE,
+    )
+
+# Шаблоны сообщения о сигнале разбираются один раз при загрузке модуля
+SIGNAL_TEMPLATE = (
+    "**📊 {signal_type} Сигнал для {symbol}**\n"
+    "*Цена*: `{price:.4f}`\n"
+    "*Таймфрейм*: `{timeframe}`\n"
+    "{rsi_line}"
+    "\n**📈 Настройки OCO-ордера**\n"
+    "- *Тейк-профит (Лимит)*: `{tp_price:.4f}`\n"
+    "- *Стоп-лосс (Триггер)*: `{sl_trigger:.4f}`\n"
+    "- *Стоп-лосс (Рыночная)*: `{sl_market:.4f}`\n"
+).format
+RSI_LINE_TEMPLATE = "*RSI*: `{:.1f} → {:.1f}`\n".format
 
 def format_signal_message(symbol, signal_type, price, tp_price, sl_trigger, sl_market, timeframe, rsi_data=None):
-    # Форматирование сообщения о торговом сигнале для Telegram
-    message = f"**📊 {signal_type} Сигнал для {symbol}**\n"
-    message += f"*Цена*: `{price:.4f}`\n"
-    message += f"*Таймфрейм*: `{timeframe}`\n"
-    if rsi_data:
-        prev_rsi, curr_rsi = rsi_data
-        message += f"*RSI*: `{prev_rsi:.1f} → {curr_rsi:.1f}`\n"
-    message += "\n**📈 Настройки OCO-ордера**\n"
-    message += f"- *Тейк-профит (Лимит)*: `{tp_price:.4f}`\n"
-    message += f"- *Стоп-лосс (Триггер)*: `{sl_trigger:.4f}`\n"
-    message += f"- *Стоп-лосс (Рыночная)*: `{sl_market:.4f}`\n"
-    return message
+    # Форматирование сообщения о торговом сигнале для Telegram одним вызовом format
+    return SIGNAL_TEMPLATE(
+        signal_type=signal_type, symbol=symbol, price=price, timeframe=timeframe,
+        rsi_line=RSI_LINE_TEMPLATE(*rsi_data) if rsi_data else '',
+        tp_price=tp_price, sl_trigger=sl_trigger, sl_market=sl_market
+    )
+
+def evaluate_signals(symbol, ind, last_signals_7_30, last_signals_9_20_rsi, factors):
+    # Проверка обеих стратегий по индикаторам пары; возвращает пары (сообщение, ключ сигнала)
+    # о новых сигналах и запоминает их в last_signals_*. Ключ (стратегия, пара, сигнал)
+    # сохраняется в файл только после доставки сообщения
+    if not has_crossover(ind):
+        # Обычный случай: пересечений нет, проверки стратегий и расчёт OCO не нужны
+        return []
+    messages = []
+    price = ind.close_last
+
+    # Проверка сигнала по стратегии EMA7/EMA30
+    signal_7_30 = check_signal_ema7_30(ind)
+    if signal_7_30 and last_signals_7_30.get(symbol) != signal_7_30:
+        tp, sl_tr, sl_mkt = calc_oco_prices(signal_7_30 == "LONG", price, factors)
+        messages.append((format_signal_message(
+            symbol, f"EMA7/30 {signal_7_30}", price, tp, sl_tr, sl_mkt, TIMEFRAME
+        ), ('ema7_30', symbol, signal_7_30)))
+        logger.info('EMA7/30 — %s: %s (цена %s)', symbol, signal_7_30, price)
+        last_signals_7_30[symbol] = signal_7_30
+
+    # Проверка сигнала по стратегии EMA9/EMA20 + RSI
+    signal_9_20_rsi = check_signal_ema9_20_rsi(ind)
+    if signal_9_20_rsi and last_signals_9_20_rsi.get(symbol) != signal_9_20_rsi:
+        tp, sl_tr, sl_mkt = calc_oco_prices(signal_9_20_rsi == "LONG (RSI)", price, factors)
+        messages.append((format_signal_message(
+            symbol, f"EMA9/20+RSI {signal_9_20_rsi}", price, tp, sl_tr, sl_mkt,
+            TIMEFRAME, (ind.rsi_prev, ind.rsi_last)
+        ), ('ema9_20_rsi', symbol, signal_9_20_rsi)))
+        logger.info(
+            'EMA9/20+RSI — %s: %s (цена %s) RSI: %.1f→%.1f',
+            symbol, signal_9_20_rsi, price, ind.rsi_prev, ind.rsi_last
+        )
+        last_signals_9_20_rsi[symbol] = signal_9_20_rsi
+    return messages
+
+async def close_clients(exchange, http_session, bot):
+    # Биржа не закрывает переданную ей сессию aiohttp — она закрывается отдельно
+    await exchange.close()
+    await http_session.close()
+    await bot.close_session()
 
 async def main():
     # Запуск основной функции бота
     logger.debug("Запуск основной функции main()")
+    # После перезапуска (ema_signals_bot.py) буферы и состояние индикаторов прошлого запуска
+    # не используются: история восстанавливается из хранилища свечей и REST
+    candle_buffers.clear()
+    stream_updated.clear()
+    indicator_states.clear()
     import src.config as config
-    check_tokens(config, logger)
+    settings = check_tokens(config, logger)
+    chat_id = settings.chat_id
+    factors = oco_factors(settings.tp, settings.sl)
 
-    bot = telebot.TeleBot(TELEGRAM_TOKEN, state_storage=StateMemoryStorage())
-    register_handlers(bot, config, logger)
-    setup_bot_commands(bot)
+    # Асинхронный клиент Telegram: отправка и опрос обновлений идут в том же цикле asyncio
+    bot = AsyncTeleBot(settings.token, state_storage=StateMemoryStorage())
+    register_handlers(bot, settings, logger)
+    await setup_bot_commands(bot)
 
-    exchange = ccxt.bybit({'enableRateLimit': True})
-    last_signals_7_30 = {}
-    last_signals_9_20_rsi = {}
+    # Общий пул соединений для REST-запросов ccxt: TLS-соединения и DNS-ответы переиспользуются
+    # между запросами, а не устанавливаются заново на каждом тике
+    connector = aiohttp.TCPConnector(
+        ssl=ssl.create_default_context(cafile=certifi.where()),
+        limit=HTTP_POOL_LIMIT, keepalive_timeout=HTTP_KEEPALIVE_SECONDS, ttl_dns_cache=HTTP_DNS_CACHE_SECONDS
+    )
+    http_session = aiohttp.ClientSession(connector=connector)
+    exchange = ccxtpro.bybit({
+        'enableRateLimit': True, 'rateLimit': EXCHANGE_RATE_LIMIT_MS, 'session': http_session,
+        'options': {'defaultType': 'spot'}
+    })
+    # Бот работает только со спотовыми парами: load_markets не загружает фьючерсы и опционы
+    fetch_markets = exchange.options.get('fetchMarkets')
+    if isinstance(fetch_markets, dict):
+        fetch_markets['types'] = ['spot']
+    else:
+        exchange.options['fetchMarkets'] = ['spot']
+    fetch_semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+    # sent_signals — доставленные сигналы (сохраняются в файл), last_signals_* — сигналы,
+    # уже поставленные в очередь: по ним отсекаются повторы внутри запуска
+    sent_signals = dict(zip(('ema7_30', 'ema9_20_rsi'), load_last_signals()))
+    last_signals_7_30 = dict(sent_signals['ema7_30'])
+    last_signals_9_20_rsi = dict(sent_signals['ema9_20_rsi'])
+    # Последняя свеча (время открытия, close), по которой уже проверялись сигналы пары
+    last_evaluated = {}
     error_count = 0
-    last_status_time = datetime.now(timezone.utc)
-    last_ping_time = datetime.now(timezone.utc)
+    # Отметки времени статуса и пинга по монотонным часам: не зависят от перевода системных часов
+    last_status_time = time.monotonic()
+    last_ping_time = time.monotonic()
 
     try:
         # Проверка доступности торговых пар
         global SYMBOLS
         symbols = await validate_symbols(exchange, SYMBOLS)
-        logger.info(f'Доступные пары: {symbols}')
-        send_message(bot, TELEGRAM_CHAT_ID, f'✅ *Бот запущен*: Проверены торговые пары ({len(symbols)})', logger)
+        logger.info('Доступные пары: %s', symbols)
+        await send_message(bot, chat_id, f'✅ *Бот запущен*: Проверены торговые пары ({len(symbols)})', logger)
     except Exception as e:
         error_msg = f'❌ *Критическая ошибка*: Не удалось загрузить торговые пары: {e}'
         logger.critical(error_msg)
-        send_message(bot, TELEGRAM_CHAT_ID, error_msg, logger)
-        await exchange.close()
+        await send_message(bot, chat_id, error_msg, logger)
+        await close_clients(exchange, http_session, bot)
         return
 
     try:
         # Тестовый запрос к бирже
         test_symbol = symbols[0]
-        await get_ohlcv(exchange, test_symbol, log_candles=True)
-        logger.info(f'Успешный тестовый запрос для {test_symbol}')
-        send_message(bot, TELEGRAM_CHAT_ID, f'✅ *Бот запущен*: Успешный тестовый запрос для {test_symbol}', logger)
+        await get_ohlcv(exchange, test_symbol, fetch_semaphore, log_candles=True)
+        logger.info('Успешный тестовый запрос для %s', test_symbol)
+        await send_message(bot, chat_id, f'✅ *Бот запущен*: Успешный тестовый запрос для {test_symbol}', logger)
     except Exception as e:
         error_msg = f'❌ *Критическая ошибка*: Не удалось подключиться к бирже: {e}'
         logger.critical(error_msg)
-        send_message(bot, TELEGRAM_CHAT_ID, error_msg, logger)
-        await exchange.close()
+        await send_message(bot, chat_id, error_msg, logger)
+        await close_clients(exchange, http_session, bot)
         return
 
     logger.info('Бот сигналов EMA (две стратегии) запущен.')
+    # Закрытые свечи сохраняются между перезапусками; сохранённые ранее подхватываются сразу
+    candle_store = open_candle_store(CANDLE_STORE_FILE)
+    restore_candle_buffers(candle_store, symbols)
+    # Время открытия последней сохранённой закрытой свечи по каждой паре
+    stored_until = {}
+    # WebSocket-потоки свечей; при сбое потока пара прозрачно переходит на REST
+    # Устанавливается потоком WebSocket, когда у какой-либо пары открылась новая свеча.
+    # Создаётся на каждый запуск main(): asyncio.Event привязывается к своему циклу событий
+    candle_closed = asyncio.Event()
+    stream_tasks = []
+    if USE_WEBSOCKET and exchange.has.get('watchOHLCVForSymbols'):
+        stream_tasks = [asyncio.create_task(watch_candles_for_symbols(exchange, symbols, candle_closed))]
+    elif USE_WEBSOCKET:
+        stream_tasks = [
+            asyncio.create_task(watch_candles(exchange, symbol, candle_closed)) for symbol in symbols
+        ]
+    # Опрос обновлений Telegram (команды) — отдельная задача вместо потока с infinity_polling
+    polling_task = asyncio.create_task(bot.infinity_polling())
+    # Сообщения из основного цикла отправляет отдельная задача через очередь
+    send_queue = asyncio.Queue()
+
+    def mark_sent(keys):
+        # В файл попадают только сигналы, сообщения о которых доставлены в Telegram:
+        # недоставленные после перезапуска будут отправлены снова
+        for strategy, symbol, signal in keys:
+            sent_signals[strategy][symbol] = signal
+        save_last_signals(sent_signals['ema7_30'], sent_signals['ema9_20_rsi'])
+
+    sender_task = asyncio.create_task(
+        run_sender(bot, chat_id, send_queue, logger, TELEGRAM_SEND_INTERVAL, mark_sent)
+    )
+    loop = asyncio.get_running_loop()
+    next_deadline = loop.time()
 
     while True:
         try:
-            # Непрерывная проверка сигналов с задержкой 15 минут
+            # Проверка сигналов по закрытию свечи (WebSocket) или каждые CHECK_INTERVAL секунд (15 минут)
             logger.debug("Начало обработки всех торговых пар")
-            tasks = [get_ohlcv(exchange, symbol, log_candles=True) for symbol in symbols]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            logger.debug("Завершено получение данных для всех пар")
+            # Пары обрабатываются по мере получения данных, а не после самого медленного запроса
+            tasks = [get_ohlcv_tagged(exchange, symbol, fetch_semaphore, log_candles=True) for symbol in symbols]
 
             success_count = 0
-            for symbol, result in zip(symbols, results):
+            # Сигналы за итерацию собираются и отправляются одним сообщением
+            signal_messages = []
+            to_seed = []
+            for next_result in asyncio.as_completed(tasks):
+                symbol, result = await next_result
                 if isinstance(result, Exception):
-                    logger.error(f'Ошибка обработки {symbol}: {result}')
+                    logger.error('Ошибка обработки %s: %s', symbol, result)
                     continue
                 success_count += 1
-                df = result
-                price = df['close'].iloc[-1]
-
-                # Проверка сигнала по стратегии EMA7/EMA30
-                signal_7_30 = check_signal_ema7_30(df, LIMIT)
-                if signal_7_30 and last_signals_7_30.get(symbol) != signal_7_30:
-                    tp, sl_tr, sl_mkt = calc_oco_prices(signal_7_30, price)
-                    message = format_signal_message(
-                        symbol, f"EMA7/30 {signal_7_30}", price, tp, sl_tr, sl_mkt, TIMEFRAME
-                    )
-                    send_message(bot, TELEGRAM_CHAT_ID, message, logger)
-                    logger.info(f'EMA7/30 — {symbol}: {signal_7_30} (цена {price})')
-                    last_signals_7_30[symbol] = signal_7_30
-
-                # Проверка сигнала по стратегии EMA9/EMA20 + RSI
-                signal_9_20_rsi = check_signal_ema9_20_rsi(df, LIMIT)
-                if signal_9_20_rsi and last_signals_9_20_rsi.get(symbol) != signal_9_20_rsi:
-                    tp, sl_tr, sl_mkt = calc_oco_prices(signal_9_20_rsi, price)
-                    message = format_signal_message(
-                        symbol, f"EMA9/20+RSI {signal_9_20_rsi}", price, tp, sl_tr, sl_mkt,
-                        TIMEFRAME, (df['rsi'].iloc[-2], df['rsi'].iloc[-1])
-                    )
-                    send_message(bot, TELEGRAM_CHAT_ID, message, logger)
-                    logger.info(
-                        f'EMA9/20+RSI — {symbol}: {signal_9_20_rsi} (цена {price}) '
-                        f'RSI: {df["rsi"].iloc[-2]:.1f}→{df["rsi"].iloc[-1]:.1f}'
+                if result.shape[0] < LIMIT:
+                    continue
+                # Новые закрытые свечи пары дописываются в хранилище
+                closed = result[:-1]
+                new_closed = closed[closed[:, 0] > stored_until.get(symbol, -1)]
+                if len(new_closed):
+                    save_candles(candle_store, symbol, TIMEFRAME, new_closed)
+                    stored_until[symbol] = closed[-1, 0]
+                # Если последняя свеча не изменилась с прошлой проверки, индикаторы и сигналы
+                # те же самые — пара пропускается до расчёта индикаторов
+                last_candle = (result[-1, 0], result[-1, 4])
+                if last_evaluated.get(symbol) == last_candle:
+                    continue
+                last_evaluated[symbol] = last_candle
+                buffer = result[-LIMIT:]
+                ind = advance_indicators(symbol, buffer)
+                if ind is None:
+                    # Пары без состояния копятся и инициализируются одним пакетом после цикла
+                    to_seed.append((symbol, buffer))
+                    continue
+                signal_messages += evaluate_signals(
+                    symbol, ind, last_signals_7_30, last_signals_9_20_rsi, factors
+                )
+            if to_seed:
+                seeded = seed_indicators([symbol for symbol, _ in to_seed], [buffer for _, buffer in to_seed])
+                for (symbol, _), ind in zip(to_seed, seeded):
+                    signal_messages += evaluate_signals(
+                        symbol, ind, last_signals_7_30, last_signals_9_20_rsi, factors
                     )
-                    last_signals_9_20_rsi[symbol] = signal_9_20_rsi
+            candle_store.commit()
+            logger.debug("Завершено получение данных для всех пар")
+
+            if signal_messages:
+                enqueue_messages(
+                    send_queue, [message for message, _ in signal_messages], TELEGRAM_MESSAGE_LIMIT,
+                    [key for _, key in signal_messages]
+                )
 
-            logger.info(f'Успешно обработано {success_count}/{len(symbols)} пар')
+            logger.info('Успешно обработано %d/%d пар', success_count, len(symbols))
 
             if success_count > 0:
                 error_count = 0
 
             # Отправка периодического статуса
-            now = datetime.now(timezone.utc)
-            if (now - last_status_time).total_seconds() >= STATUS_INTERVAL:
-                send_message(bot, TELEGRAM_CHAT_ID, f'🔔 *Статус бота*: Обработано {success_count}/{len(symbols)} пар', logger)
+            now = time.monotonic()
+            if now - last_status_time >= STATUS_INTERVAL:
+                send_queue.put_nowait((f'🔔 *Статус бота*: Обработано {success_count}/{len(symbols)} пар', []))
                 logger.info("Отправлен статус бота")
                 last_status_time = now
 
             # Отправка периодического пинга
-            if (now - last_ping_time).total_seconds() >= PING_INTERVAL:
-                send_message(bot, TELEGRAM_CHAT_ID, '🔔 *Бот сигналов EMA*: Работает!', logger)
+            if now - last_ping_time >= PING_INTERVAL:
+                send_queue.put_nowait(('🔔 *Бот сигналов EMA*: Работает!', []))
                 logger.info('Отправлено пинг-сообщение (6ч)')
                 last_ping_time = now
 
-            # Логирование ожидания в старом формате
-            next_check = now + timedelta(seconds=900)
-            wait_seconds = (next_check - now).total_seconds()
-            logger.debug(f'Ожидание {wait_seconds:.1f} секунд до следующей проверки в {next_check.strftime("%Y-%m-%d %H:%M:%S")}+00:00')
-
-            # Задержка 15 минут
-            await asyncio.sleep(900)
+            # Ожидание до абсолютного дедлайна по монотонным часам цикла:
+            # время обработки не накапливается в дрейф расписания
+            if next_deadline <= loop.time():
+                next_deadline += CHECK_INTERVAL
+                if next_deadline < loop.time():
+                    # Итерация затянулась дольше интервала — пропущенные слоты не навёрстываем
+                    next_deadline = loop.time()
+            wait_seconds = next_deadline - loop.time()
+            logger.debug('Ожидание %.1f секунд до следующей проверки', wait_seconds)
+            if stream_tasks:
+                # С WebSocket проверка запускается сразу по закрытию свечи; дедлайн остаётся
+                # запасным расписанием на случай сбоя потока
+                try:
+                    await asyncio.wait_for(candle_closed.wait(), wait_seconds)
+                    # Короткая пауза, чтобы закрытие свечи пришло и по остальным парам
+                    await asyncio.sleep(CANDLE_CLOSE_DELAY)
+                except asyncio.TimeoutError:
+                    pass
+                candle_closed.clear()
+            else:
+                # Без WebSocket проверка приурочена к закрытию свечи TIMEFRAME (через
+                # CANDLE_CLOSE_DELAY), если оно наступит раньше дедлайна
+                now_ms = time.time_ns() // 1_000_000
+                until_close = ((now_ms // TIMEFRAME_MS + 1) * TIMEFRAME_MS - now_ms) / 1000 + CANDLE_CLOSE_DELAY
+                await asyncio.sleep(min(wait_seconds, max(MIN_WAIT_SECONDS, until_close)))
 
         except Exception as error:
             # Обработка критических ошибок
             error_count += 1
-            logger.error(f'Критическая ошибка в цикле: {error}')
+            logger.error('Критическая ошибка в цикле: %s', error)
             if error_count >= ERROR_THRESHOLD:
                 error_msg = f'❌ *Критическая ошибка*: Бот остановлен из-за повторяющихся сбоев: {error}'
-                send_message(bot, TELEGRAM_CHAT_ID, error_msg, logger)
+                send_queue.put_nowait((error_msg, []))
                 logger.critical('Бот остановлен из-за превышения порога ошибок')
                 break
 
-    # Закрытие соединения с биржей
-    await exchange.close()
+    # Неотправленные сообщения досылаются, но не дольше TELEGRAM_DRAIN_TIMEOUT секунд
+    try:
+        await asyncio.wait_for(send_queue.join(), TELEGRAM_DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning('Не отправлено сообщений из очереди: %d', send_queue.qsize())
+    # Остановка WebSocket-потоков, опроса и отправки Telegram, закрытие соединений
+    background_tasks = stream_tasks + [polling_task, sender_task]
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await close_clients(exchange, http_session, bot)
+    candle_store.close()
     logger.debug("Биржа закрыта")
     
\ No newline at end of file
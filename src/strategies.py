@@ -1,59 +1,157 @@
-import pandas as pd
-
-def calc_ema(df, period):
-    return df['close'].ewm(span=period, adjust=False).mean()
-
-def calc_rsi(df, period=14):
-    delta = df['close'].diff()
-    up = delta.clip(lower=0)
-    down = -delta.clip(upper=0)
-    avg_gain = up.rolling(window=period, min_periods=period).mean()
-    avg_loss = down.rolling(window=period, min_periods=period).mean()
-    rs = avg_gain / avg_loss.where(avg_loss != 0, 1e-10)
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
-
-def check_signal_ema7_30(df, limit):
-    if len(df) < limit:
-        return None
-    df['ema7'] = calc_ema(df, 7)
-    df['ema30'] = calc_ema(df, 30)
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from src.kernels import (
+    HAS_NUMBA, ALPHA7, ALPHA30, ALPHA9, ALPHA20, indicator_state, indicator_states_batch
+)
+
+# Заранее скомпилированное ядро (python compile_kernels.py) не требует JIT при старте.
+# Модуль нужно пересобирать после каждого изменения src/kernels.py.
+try:
+    from src.ema_kernels import indicator_state
+    HAS_AOT = True
+except ImportError:
+    HAS_AOT = False
+
+# Множители (1 - alpha) для шага EMA и пороги RSI стратегии EMA9/20 — константы модуля
+DECAY7, DECAY30, DECAY9, DECAY20 = 1 - ALPHA7, 1 - ALPHA30, 1 - ALPHA9, 1 - ALPHA20
+RSI_LONG_LEVEL, RSI_SHORT_LEVEL = 55.0, 45.0
+
+# Два последних значения (предыдущая и текущая свеча) всех индикаторов обеих стратегий
+Indicators = namedtuple('Indicators', [
+    'close_prev', 'close_last',
+    'ema7_prev', 'ema7_last', 'ema30_prev', 'ema30_last',
+    'ema9_prev', 'ema9_last', 'ema20_prev', 'ema20_last',
+    'rsi_prev', 'rsi_last',
+])
+
+# Состояние рекуррентных индикаторов после последней закрытой свечи;
+# close — её цена закрытия (нужна для приращения RSI на следующем шаге)
+IndicatorState = namedtuple('IndicatorState', [
+    'ema7', 'ema30', 'ema9', 'ema20', 'avg_gain', 'avg_loss', 'close',
+])
+
+if not HAS_NUMBA and not HAS_AOT:
+    # Без Numba начальные EMA и средние Уайлдера считаются однополюсными IIR-фильтрами в C-цикле scipy
+    try:
+        from scipy.signal import lfilter
+    except ImportError:
+        lfilter = None
+
+    if lfilter is not None:
+        def indicator_states_batch(closes, rsi_period):
+            # Все пары за один вызов lfilter по оси свечей: EMA и сглаживание Уайлдера —
+            # однополюсные IIR-фильтры
+            out = np.empty((closes.shape[0], 6))
+            for j, period in enumerate((7, 30, 9, 20)):
+                alpha = 2.0 / (period + 1)
+                ema, _ = lfilter([alpha], [1.0, alpha - 1.0], closes, axis=1, zi=(1 - alpha) * closes[:, :1])
+                out[:, j] = ema[:, -1]
+            delta = np.diff(closes, axis=1)
+            beta = 1.0 / rsi_period
+            for j, values in ((4, np.clip(delta, 0, None)), (5, np.clip(-delta, 0, None))):
+                # Начальное среднее — простое среднее первых rsi_period изменений
+                avg = values[:, :rsi_period].sum(axis=1) / rsi_period
+                if values.shape[1] > rsi_period:
+                    smoothed, _ = lfilter(
+                        [beta], [1.0, beta - 1.0], values[:, rsi_period:], axis=1,
+                        zi=((1 - beta) * avg)[:, None]
+                    )
+                    avg = smoothed[:, -1]
+                out[:, j] = avg
+            return out
+
+if HAS_AOT or (not HAS_NUMBA and lfilter is None):
+    # Параллельное ядро не компилируется заранее: без JIT пары обходятся циклом
+    def indicator_states_batch(closes, rsi_period):
+        out = np.empty((closes.shape[0], 6))
+        for s in range(closes.shape[0]):
+            out[s] = indicator_state(closes[s], rsi_period)
+        return out
+
+# Прогрев JIT при импорте, чтобы компиляция не попадала в основной цикл
+if HAS_NUMBA and not HAS_AOT:
+    _warmup = np.zeros(16, dtype=np.float64)
+    indicator_states_batch(_warmup.reshape(2, 8), 14)
+
+def seed_indicator_states(closes):
+    # Начальные состояния по истории закрытых свечей (пары × свечи) одним вызовом ядра
+    # tolist() отдаёт обычные float: дальнейшие шаги и сравнения идут без скаляров NumPy
+    values = indicator_states_batch(closes, 14).tolist()
+    return [IndicatorState(*row, c) for row, c in zip(values, closes[:, -1].tolist())]
+
+def advance_indicator_state(state, close, rsi_period=14):
+    # Один шаг рекуррентных формул EMA и RSI Уайлдера — O(1) вместо пересчёта всей истории
+    delta = close - state.close
+    gain = delta if delta > 0 else 0.0
+    loss = -delta if delta < 0 else 0.0
+    return IndicatorState(
+        ALPHA7 * close + DECAY7 * state.ema7,
+        ALPHA30 * close + DECAY30 * state.ema30,
+        ALPHA9 * close + DECAY9 * state.ema9,
+        ALPHA20 * close + DECAY20 * state.ema20,
+        (state.avg_gain * (rsi_period - 1) + gain) / rsi_period,
+        (state.avg_loss * (rsi_period - 1) + loss) / rsi_period,
+        close,
+    )
+
+def _rsi_from_state(state):
+    return 100 - 100 / (1 + state.avg_gain / max(state.avg_loss, 1e-10))
+
+def indicators_from_state(state, close_last):
+    # Значения на закрытой свече берутся из состояния, на текущей — один шаг без сохранения
+    last = advance_indicator_state(state, close_last)
+    return Indicators(
+        state.close, close_last,
+        state.ema7, last.ema7, state.ema30, last.ema30,
+        state.ema9, last.ema9, state.ema20, last.ema20,
+        _rsi_from_state(state), _rsi_from_state(last),
+    )
+
+def has_crossover(ind):
+    # Пересечение есть, только если разность EMA сменила знак между двумя последними барами;
+    # без него ни одна стратегия не даёт сигнала
+    return (
+        (ind.ema7_prev - ind.ema30_prev) * (ind.ema7_last - ind.ema30_last) < 0 or
+        (ind.ema9_prev - ind.ema20_prev) * (ind.ema9_last - ind.ema20_last) < 0
+    )
+
+def check_signal_ema7_30(ind):
+    # Значения читаются в локальные переменные один раз, сравнения идут без обращений к атрибутам
+    price = ind.close_last
+    ema7_prev, ema7_last = ind.ema7_prev, ind.ema7_last
+    ema30_prev, ema30_last = ind.ema30_prev, ind.ema30_last
     if (
-        df['ema7'].iloc[-2] < df['ema30'].iloc[-2] and
-        df['ema7'].iloc[-1] > df['ema30'].iloc[-1] and
-        df['close'].iloc[-1] > df['ema7'].iloc[-1] and
-        df['close'].iloc[-1] > df['ema30'].iloc[-1]
+        ema7_prev < ema30_prev and
+        ema7_last > ema30_last and
+        price > ema7_last and
+        price > ema30_last
     ):
         return "LONG"
     elif (
-        df['ema7'].iloc[-2] > df['ema30'].iloc[-2] and
-        df['ema7'].iloc[-1] < df['ema30'].iloc[-1] and
-        df['close'].iloc[-1] < df['ema7'].iloc[-1] and
-        df['close'].iloc[-1] < df['ema30'].iloc[-1]
+        ema7_prev > ema30_prev and
+        ema7_last < ema30_last and
+        price < ema7_last and
+        price < ema30_last
     ):
         return "SHORT"
     return None
 
-def check_signal_ema9_20_rsi(df, limit):
-    if len(df) < limit:
+def check_signal_ema9_20_rsi(ind):
+    # Сначала проверяется дешёвое пересечение EMA9/EMA20 — без него RSI не читается вовсе
+    ema9_prev, ema9_last = ind.ema9_prev, ind.ema9_last
+    ema20_prev, ema20_last = ind.ema20_prev, ind.ema20_last
+    if ema9_prev < ema20_prev and ema9_last > ema20_last:
+        direction = "LONG (RSI)"
+    elif ema9_prev > ema20_prev and ema9_last < ema20_last:
+        direction = "SHORT (RSI)"
+    else:
         return None
-    df['ema9'] = calc_ema(df, 9)
-    df['ema20'] = calc_ema(df, 20)
-    df['rsi'] = calc_rsi(df, 14)
-    if pd.isna(df['rsi'].iloc[-1]) or pd.isna(df['rsi'].iloc[-2]):
+    rsi_prev, rsi_last = ind.rsi_prev, ind.rsi_last
+    if math.isnan(rsi_last) or math.isnan(rsi_prev):
         return None
-    if (
-        df['ema9'].iloc[-2] < df['ema20'].iloc[-2] and
-        df['ema9'].iloc[-1] > df['ema20'].iloc[-1] and
-        df['rsi'].iloc[-2] > 55 and
-        df['rsi'].iloc[-1] <= 55
-    ):
-        return "LONG (RSI)"
-    elif (
-        df['ema9'].iloc[-2] > df['ema20'].iloc[-2] and
-        df['ema9'].iloc[-1] < df['ema20'].iloc[-1] and
-        df['rsi'].iloc[-2] < 45 and
-        df['rsi'].iloc[-1] >= 45
-    ):
-        return "SHORT (RSI)"
-    return None
+    if direction == "LONG (RSI)":
+        return direction if rsi_prev > RSI_LONG_LEVEL and rsi_last <= RSI_LONG_LEVEL else None
+    return direction if rsi_prev < RSI_SHORT_LEVEL and rsi_last >= RSI_SHORT_LEVEL else None
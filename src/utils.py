@@ -1,42 +1,66 @@
+import asyncio
+import atexit
 import logging
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
 
-def setup_logging():
+# uvloop (необязательный, только Linux/macOS) — более быстрый цикл событий для сетевых запросов
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+def setup_logging(level='INFO'):
     logger = logging.getLogger(__name__)
-    logger.setLevel(logging.DEBUG)
+    # Уровень задаётся через LOG_LEVEL; сообщения ниже уровня не форматируются вовсе
+    logger.setLevel(level)
     stream_handler = logging.StreamHandler(sys.stdout)
     stream_handler.setLevel(logging.DEBUG)
     # Убираем указание модуля из формата логов
     stream_handler.setFormatter(
         logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     )
-    logger.addHandler(stream_handler)
     file_handler = logging.FileHandler('ema_signals.log', encoding='utf-8')
     file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(
         logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     )
-    logger.addHandler(file_handler)
+    # Запись в консоль и файл идёт в фоновом потоке QueueListener:
+    # в цикле asyncio логирование сводится к помещению записи в очередь
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, stream_handler, file_handler, respect_handler_level=True)
+    listener.start()
+    # При завершении процесса оставшиеся записи дописываются до остановки потока
+    atexit.register(listener.stop)
     return logger
 
+def run_event_loop(coro):
+    # Общая точка запуска для run.py и ema_signals_bot.py: цикл uvloop, если он установлен,
+    # иначе стандартный цикл asyncio
+    loop_factory = uvloop.new_event_loop if uvloop is not None else None
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        return runner.run(coro)
+
 class MissingTokenError(Exception):
     pass
 
 def check_tokens(config, logger):
-    required_vars = {
-        'TELEGRAM_TOKEN': config.TELEGRAM_TOKEN,
-        'TELEGRAM_CHAT_ID': config.TELEGRAM_CHAT_ID,
-        'TAKE_PROFIT_PERCENT': config.TP_PERCENT,
-        'STOP_LOSS_PERCENT': config.SL_PERCENT
-    }
-    missing = [key for key, value in required_vars.items() if not value]
+    # TP/SL уже разобраны в float при загрузке config (со значениями по умолчанию);
+    # проверяются только строки Telegram. Нулевой TP/SL отсекается проверкой ниже,
+    # а не принимается за отсутствующую переменную
+    missing = []
+    if not config.TELEGRAM_TOKEN:
+        missing.append('TELEGRAM_TOKEN')
+    if not config.TELEGRAM_CHAT_ID:
+        missing.append('TELEGRAM_CHAT_ID')
     if missing:
         error_msg = f'Бот остановлен. Отсутствуют переменные окружения: {", ".join(missing)}'
         logger.critical(error_msg)
         raise MissingTokenError(error_msg)
     try:
-        int(config.TELEGRAM_CHAT_ID)
-        # Убрано логирование TELEGRAM_CHAT_ID
+        chat_id = int(config.TELEGRAM_CHAT_ID)
     except ValueError:
         error_msg = 'TELEGRAM_CHAT_ID должен быть числом.'
         logger.critical(error_msg)
@@ -45,17 +69,78 @@ def check_tokens(config, logger):
         error_msg = 'TP/SL должны быть положительными числами.'
         logger.critical(error_msg)
         raise MissingTokenError(error_msg)
+    if config.TP_PERCENT >= 100 or config.SL_PERCENT >= 100:
+        # При TP/SL от 100% тейк-профит SHORT или стоп LONG становится нулевой
+        # или отрицательной ценой
+        error_msg = 'TP/SL должны быть меньше 100%.'
+        logger.critical(error_msg)
+        raise MissingTokenError(error_msg)
+    return config.Config(
+        token=config.TELEGRAM_TOKEN, chat_id=chat_id,
+        tp=config.TP_PERCENT, sl=config.SL_PERCENT
+    )
 
-def send_message(bot, chat_id, message, logger):
+async def send_message(bot, chat_id, message, logger):
+    # Асинхронная отправка: запрос к Bot API не блокирует цикл asyncio.
+    # Возвращает True, если сообщение доставлено
     try:
-        bot.send_message(chat_id, message, parse_mode='Markdown')
+        await bot.send_message(chat_id, message, parse_mode='Markdown')
         logger.info('Сообщение отправлено в Telegram.')
+        return True
     except Exception as e:
-        logger.error(f'Ошибка отправки сообщения в Telegram: {e}')
+        logger.error('Ошибка отправки сообщения в Telegram: %s', e)
+        return False
+
+def split_message(parts, limit, separator='\n\n---\n\n'):
+    # Склейка частей в сообщения не длиннее limit символов (ограничение Telegram — 4096).
+    # Для каждого сообщения возвращаются и номера частей, которые в нём завершаются
+    chunks = []
+    current = ''
+    indices = []
+    for i, part in enumerate(parts):
+        while len(part) > limit:
+            # Слишком длинная часть режется на куски по limit символов
+            if current:
+                chunks.append((current, indices))
+                current = ''
+                indices = []
+            chunks.append((part[:limit], []))
+            part = part[limit:]
+        if not current:
+            current = part
+        elif len(current) + len(separator) + len(part) <= limit:
+            current += separator + part
+        else:
+            chunks.append((current, indices))
+            current = part
+            indices = []
+        indices.append(i)
+    if current:
+        chunks.append((current, indices))
+    return chunks
+
+def enqueue_messages(queue, parts, limit, keys=None):
+    # Сигналы итерации склеиваются в сообщения не длиннее limit и ставятся в очередь
+    # отправки без ожидания Telegram; keys[i] — ключ части i, передаётся в on_sent
+    # после доставки сообщения с этой частью
+    for chunk, indices in split_message(parts, limit):
+        queue.put_nowait((chunk, [keys[i] for i in indices] if keys else []))
+
+async def run_sender(bot, chat_id, queue, logger, interval, on_sent=None):
+    # Фоновая отправка из очереди: пауза между сообщениями соблюдает ограничение Telegram
+    # на частоту сообщений в один чат и не задерживает основной цикл
+    while True:
+        message, keys = await queue.get()
+        try:
+            if await send_message(bot, chat_id, message, logger) and keys and on_sent is not None:
+                on_sent(keys)
+        finally:
+            queue.task_done()
+        await asyncio.sleep(interval)
 
 def send_critical_message(bot, chat_id, msg, logger):
     try:
         bot.send_message(chat_id, msg, parse_mode='Markdown')
         logger.info('Критическое сообщение отправлено.')
     except Exception as e:
-        logger.error(f'Ошибка отправки аварийного уведомления: {e}')
+        logger.error('Ошибка отправки аварийного уведомления: %s', e)